@@ -6,6 +6,7 @@ Usage:
     tabasco stop
     tabasco monitor <directory>
     tabasco unmonitor <directory>
+    tabasco snapshot [<directory>]
     tabasco log
     tabasco apply <commit>
     tabasco rm <commit>
@@ -20,6 +21,9 @@ Options:
 
 """
 import glob
+import json
+import select
+import socket
 from collections import namedtuple
 from io import StringIO
 from checksumdir import dirhash
@@ -42,14 +46,20 @@ Version = namedtuple('Version', ['checksum', 'time', 'name'])
 
 
 class Daemon(object):
-    """I am a daemon that calls all of the monitors and try to load new ones
-    from the configuration set in the database.
+    """I am a daemon that calls all of the monitors and listen on a control
+    socket for commands sent by the tabasco client.
+
+    The monitored directories and their versions are kept in memory, so
+    `monitor`, `unmonitor`, `snapshot` and `stop` take effect immediately
+    and `log` is answered without reopening the db files.
 
     Note:
         the debug attribute will make the daemon loop run only once.
         this is for easier unit-testing (go test a daemon, huh? :P),
         don't set this flag
     """
+    SOCKET_PATH = "control.sock"
+    REQUEST_TIMEOUT = 5
 
     def __init__(self, tabasco_folder: Path, polling_frequency: int=10,
                  debug: bool=False):
@@ -59,10 +69,22 @@ class Daemon(object):
         if not tabasco_folder.exists():
             tabasco_folder.mkdir()
 
+        self.tabasco_folder = tabasco_folder
         self.manager = Manager(tabasco_folder)
         self.polling_frequency = polling_frequency
         self.stop_file = tabasco_folder.joinpath("stop")
+        self.socket_path = tabasco_folder.joinpath(self.SOCKET_PATH)
         self.is_debug = debug
+        self.index = {}
+        self._server = None
+        self._stopping = False
+        self._handlers = {"monitor": self._on_monitor,
+                          "unmonitor": self._on_unmonitor,
+                          "snapshot": self._on_snapshot,
+                          "log": self._on_log,
+                          "rm": self._on_remove,
+                          "stop": self._on_stop,
+                          "ping": self._on_ping}
 
     def start(self, remove_stopfile_first=True):
         """Start the tabasco daemon.
@@ -71,25 +93,241 @@ class Daemon(object):
         if remove_stopfile_first and self.stop_file.exists():
             os.remove(str(self.stop_file))
 
-        while not self._should_stop():
-            for folder, _ in self.manager:
-                Monitor(directory=Path(folder),
-                        frequency=self.polling_frequency).run()
+        self._stopping = False
+        if self._should_stop():
+            return
 
-            if self.is_debug:
-                break
+        # Listen before reading the monitored folders, so a client is never
+        # refused (and never falls back to the db) once the daemon started.
+        self._listen()
+
+        try:
+            while not self._should_stop():
+                self._sync_index()
+                for folder in list(self.index):
+                    self._snapshot(folder)
 
-            time.sleep(self.polling_frequency)
+                if self.is_debug:
+                    break
+
+                self._serve(self.polling_frequency)
+
+        finally:
+            self._close()
 
     def stop(self):
         """Stop the tabasco daemon.
 
-        This writes a stop-file with the current date."""
-        self.stop_file.touch()
+        This asks a running daemon to stop through the control socket, and
+        writes a stop-file if no daemon is listening."""
+        try:
+            Client(self.tabasco_folder).request("stop")
+
+        except ConnectionError:
+            self.stop_file.touch()
 
     def _should_stop(self):
         """Determine whether or not we should stop."""
-        return self.stop_file.exists()
+        return self._stopping or self.stop_file.exists()
+
+    def _sync_index(self):
+        """Index folders added to the db without us (e.g. while the socket
+        couldn't be reached) and forget the ones removed from it."""
+        folders = [folder for folder, _ in self.manager]
+
+        for folder in set(self.index) - set(folders):
+            del self.index[folder]
+
+        for folder in folders:
+            if folder not in self.index:
+                self.index[folder] = list(SC(folder).versions)
+
+    def _snapshot(self, folder: str, force: bool=False):
+        """Run the monitor of a folder and index the version it created."""
+        version = Monitor(directory=Path(folder),
+                          frequency=self.polling_frequency).run(force=force)
+
+        if version is not None:
+            self.index[folder].append(version)
+
+        return version
+
+    def _listen(self):
+        """Bind the control socket, refusing to steal it from a live
+        daemon."""
+        if self.socket_path.exists():
+            try:
+                Client(self.tabasco_folder).request("ping")
+
+            except ConnectionError:
+                os.remove(str(self.socket_path))
+
+            else:
+                raise RuntimeError("tabasco is already running.")
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # Only the owner may talk to the daemon, from the moment it binds.
+        umask = os.umask(0o177)
+        try:
+            self._server.bind(str(self.socket_path))
+
+        finally:
+            os.umask(umask)
+
+        self._server.listen()
+
+    def _close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+        if self.socket_path.exists():
+            os.remove(str(self.socket_path))
+
+    def _serve(self, timeout: float):
+        """Answer client requests until the timeout passes or we're asked
+        to stop."""
+        deadline = time.monotonic() + timeout
+
+        while not self._stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            readable, _, _ = select.select([self._server], [], [], remaining)
+            if readable:
+                connection, _ = self._server.accept()
+                with connection:
+                    self._handle(connection)
+
+    def _handle(self, connection: socket.socket):
+        """Read a single request from a connection and write the response.
+
+        A client that doesn't send its request in time, or goes away before
+        reading the response, is dropped so it can't block the daemon."""
+        connection.settimeout(self.REQUEST_TIMEOUT)
+
+        try:
+            with connection.makefile("rwb") as stream:
+                response = self._respond(stream.readline())
+                stream.write(json.dumps(response).encode() + b"\n")
+                stream.flush()
+
+        except OSError:
+            pass
+
+    def _respond(self, line: bytes) -> dict:
+        """Run the command of a request line and build its response."""
+        try:
+            request = json.loads(line.decode())
+            handler = self._handlers.get(request.pop("command", None))
+            if handler is None:
+                raise ValueError("Unknown command.")
+
+            return {"result": handler(**request)}
+
+        except Exception as error:
+            return {"error": str(error)}
+
+    def _on_monitor(self, directory: str):
+        self.manager.monitor(directory)
+        self.index[directory] = list(SC(directory).versions)
+        self._snapshot(directory)
+
+    def _on_unmonitor(self, directory: str):
+        self.manager.unmonitor(directory)
+        self.index.pop(directory, None)
+
+    def _on_snapshot(self, directory: str=None):
+        if directory is not None and directory not in self.index:
+            raise LookupError("Directory isn't monitored.")
+
+        folders = list(self.index) if directory is None else [directory]
+        for folder in folders:
+            self._snapshot(folder, force=True)
+
+    def _on_log(self, directory: str):
+        versions = self.index.get(directory)
+        if versions is None:
+            versions = SC(directory).versions
+
+        return [Client.dump_version(version) for version in versions]
+
+    def _on_remove(self, directory: str, commit: str):
+        SC(directory).remove(commit)
+        if directory in self.index:
+            self.index[directory] = list(SC(directory).versions)
+
+    def _on_stop(self):
+        self._stopping = True
+
+    def _on_ping(self):
+        return __version__
+
+
+class Client(object):
+    """I know how to send commands to a running daemon through its control
+    socket.
+
+    Raises ConnectionError when no daemon is listening, so callers can fall
+    back to working on the db files directly. Once connected, failures raise
+    RuntimeError instead, since the daemon may already have run the command.
+    """
+
+    def __init__(self, tabasco_folder: Path):
+        if type(tabasco_folder) is str:
+            tabasco_folder = Path(tabasco_folder)
+
+        self.socket_path = tabasco_folder.joinpath(Daemon.SOCKET_PATH)
+
+    def request(self, command: str, **arguments):
+        """Send a command to the daemon and return its result."""
+        arguments["command"] = command
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(str(self.socket_path))
+
+            except OSError as error:
+                raise ConnectionError("tabasco daemon is not "
+                                      "running.") from error
+
+            try:
+                with client.makefile("rwb") as stream:
+                    stream.write(json.dumps(arguments).encode() + b"\n")
+                    stream.flush()
+                    line = stream.readline()
+
+            except OSError as error:
+                raise RuntimeError("Lost connection to the tabasco "
+                                   "daemon.") from error
+
+        if not line:
+            raise RuntimeError("tabasco daemon closed the connection.")
+
+        response = json.loads(line.decode())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+
+        return response["result"]
+
+    def versions(self, directory: str) -> list:
+        """list all versions of a directory from the daemon's index."""
+        return [self.load_version(version)
+                for version in self.request("log", directory=directory)]
+
+    @staticmethod
+    def dump_version(version: Version) -> dict:
+        return {"checksum": version.checksum,
+                "time": version.time.isoformat(),
+                "name": version.name}
+
+    @staticmethod
+    def load_version(version: dict) -> Version:
+        return Version(checksum=version["checksum"],
+                       time=datetime.datetime.fromisoformat(version["time"]),
+                       name=version["name"])
 
 
 class Manager(object):
@@ -159,18 +397,24 @@ class Monitor(object):
         self.versions_file = self.tabasco_directory.joinpath("versions")
         self.last_file = self.tabasco_directory.joinpath("last")
 
-    def run(self, date: datetime.datetime=None, _checksum: str=None):
-        """Back up the directory if found necessary"""
+    def run(self, date: datetime.datetime=None, _checksum: str=None,
+            force: bool=False):
+        """Back up the directory if found necessary and return the new
+        version.
+
+        Forcing skips waiting for the frequency, but an unchanged directory
+        is still not backed up."""
         if not self.tabasco_directory.exists():
             self.tabasco_directory.mkdir()
 
         now = date or datetime.datetime.now()
         checksum = _checksum or self._checksum()
 
-        if self._should_backup(now, checksum):
-            self._update_time_and_hash(now, checksum)
+        if self._should_backup(now, checksum, force):
+            version_name = self._version_name(now)
+            self._update_time_and_hash(now, checksum, version_name)
             try:
-                self._backup(now, checksum)
+                return self._backup(now, checksum, version_name)
 
             except FileExistsError:
                 raise RuntimeError("Commit failed - a commit with the same "
@@ -179,16 +423,32 @@ class Monitor(object):
     def _checksum(self):
         return dirhash(str(self.directory), ignore_hidden=True)
 
-    def _backup(self, now, checksum):
+    def _version_name(self, now):
+        """Name a version by its time, adding a counter if a version with the
+        same name already exists (e.g. forced twice in the same second)."""
+        base_name = now.strftime("%Y.%m.%d - %H.%M.%S")
+        version_name = base_name
+        counter = 1
+
+        with shelve.open(str(self.versions_file)) as versions:
+            while version_name in versions or \
+                    self.tabasco_directory.joinpath(version_name).exists():
+                counter += 1
+                version_name = "{name} ({counter})".format(name=base_name,
+                                                           counter=counter)
+
+        return version_name
+
+    def _backup(self, now, checksum, version_name):
         """Back up the directory. and save the version in versions file."""
         with shelve.open(str(self.versions_file)) as versions:
-            version_name = now.strftime("%Y.%m.%d - %H.%M.%S")
             versions[version_name] = {'time': now,
                                       'checksum': checksum,
                                       'name': version_name}
 
         version_directory = self.tabasco_directory.joinpath(version_name)
         self._commit(version_directory)
+        return Version(checksum=checksum, time=now, name=version_name)
 
     def _commit(self, version_directory: Path):
         """Copy everything to a destination path except for tabasco files"""
@@ -209,7 +469,7 @@ class Monitor(object):
                 shutil.copytree(str(path),
                                 str(version_directory.joinpath(filename)))
 
-    def _should_backup(self, now, checksum):
+    def _should_backup(self, now, checksum, force=False):
         """Determine whether or not we should run a backup by reading the
         last-file."""
         with shelve.open(str(self.last_file)) as last:
@@ -218,14 +478,13 @@ class Monitor(object):
             if last_checksum is None and last_access_time is None:
                 return True
 
-            is_old = (now - last_access_time).total_seconds() >= self.frequency
+            is_old = force or \
+                (now - last_access_time).total_seconds() >= self.frequency
             is_outdated = checksum != last_checksum
             return is_old and is_outdated
 
-    def _update_time_and_hash(self, now, checksum):
-        """Update the last-file with given time and hash."""
-        version_name = now.strftime("%Y.%m.%d - %H.%M.%S")
-
+    def _update_time_and_hash(self, now, checksum, version_name):
+        """Update the last-file with given time, hash and version name."""
         with shelve.open(str(self.last_file)) as last:
             last["checksum"] = checksum
             last["time"] = now
@@ -261,8 +520,12 @@ class SC(object):
                               time=db[key]["time"],
                               name=db[key]["name"])
 
-    def print_log(self):
-        for version in sorted(self.versions,
+    def print_log(self, versions: list=None):
+        """Print the versions, read from db unless given."""
+        if versions is None:
+            versions = self.versions
+
+        for version in sorted(versions,
                               key=lambda version: version.time):
             print(colored("commit {checksum}"
                             .format(checksum=version.checksum),
@@ -347,6 +610,10 @@ class SC(object):
 def main():
     args = docopt(__doc__)
     tabasco_path = Path.home().joinpath(".tabasco")
+    client = Client(tabasco_path)
+    # Directories are keyed by their resolved path, so a directory reached
+    # through a symlink is the same one the daemon indexed.
+    working_directory = Path.cwd().resolve()
 
     if args["start"]:
         Daemon(tabasco_path,
@@ -356,19 +623,59 @@ def main():
         Daemon(tabasco_path).stop()
 
     elif args["monitor"]:
-        Manager(tabasco_path).monitor(Path(args["<directory>"]).absolute())
+        directory = str(Path(args["<directory>"]).resolve())
+        try:
+            client.request("monitor", directory=directory)
+
+        except ConnectionError:
+            Manager(tabasco_path).monitor(directory)
 
     elif args["unmonitor"]:
-        Manager(tabasco_path).unmonitor(Path(args["<directory>"]).absolute())
+        directory = str(Path(args["<directory>"]).resolve())
+        try:
+            client.request("unmonitor", directory=directory)
+
+        except ConnectionError:
+            Manager(tabasco_path).unmonitor(directory)
+
+    elif args["snapshot"]:
+        directory = args["<directory>"]
+        if directory is not None:
+            directory = str(Path(directory).resolve())
+
+        try:
+            client.request("snapshot", directory=directory)
+
+        except ConnectionError:
+            folders = [folder for folder, _ in Manager(tabasco_path)]
+            if directory is not None:
+                if directory not in folders:
+                    raise LookupError("Directory isn't monitored.")
+
+                folders = [directory]
+
+            for folder in folders:
+                Monitor(Path(folder)).run(force=True)
 
     elif args["log"]:
-        SC(Path.cwd()).print_log()
+        try:
+            versions = client.versions(str(working_directory))
+
+        except ConnectionError:
+            versions = None
+
+        SC(working_directory).print_log(versions)
 
     elif args["apply"]:
-        SC(Path.cwd()).apply(args["<commit>"])
+        SC(working_directory).apply(args["<commit>"])
 
     elif args["rm"]:
-        SC(Path.cwd()).remove(args["<commit>"])
+        try:
+            client.request("rm", directory=str(working_directory),
+                           commit=args["<commit>"])
+
+        except ConnectionError:
+            SC(working_directory).remove(args["<commit>"])
 
     elif args["--version"]:
         print(__version__)
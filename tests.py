@@ -3,8 +3,11 @@ from pathlib import Path
 import datetime
 from unittest import TestCase
 import shutil
+import socket
+import threading
+import time
 
-from tabasco import Monitor, Manager, SC, Daemon
+from tabasco import Monitor, Manager, SC, Daemon, Client
 
 
 class MonitorCase(TestCase):
@@ -94,6 +97,20 @@ class MonitorCase(TestCase):
 
         self.assertEqual(len(versions), 2)
 
+    def test_forced_backups_in_the_same_second(self):
+        now = datetime.datetime(1997, 10, 2, 12)
+        monitor = Monitor("temp", frequency=300)
+        monitor.run(date=now, _checksum="Hello")
+        monitor.run(date=now, _checksum="World", force=True)
+
+        versions = sorted(SC("temp").versions,
+                          key=lambda version: version.name)
+        self.assertEqual([version.checksum for version in versions],
+                         ["Hello", "World"])
+        self.assertEqual([version.name for version in versions],
+                         ["1997.10.02 - 12.00.00",
+                          "1997.10.02 - 12.00.00 (2)"])
+
 
     def tearDown(self):
         shutil.rmtree("temp")
@@ -274,3 +291,110 @@ class DaemonCase(TestCase):
     def tearDown(self):
         shutil.rmtree(".tbsc.temp")
         shutil.rmtree("temp")
+
+
+class ClientCase(TestCase):
+    def setUp(self):
+        os.makedirs(".tbsc.temp")
+        os.makedirs("temp")
+        self.client = Client(".tbsc.temp")
+
+    def _start_daemon(self):
+        daemon = Daemon(".tbsc.temp", polling_frequency=60)
+        daemon.REQUEST_TIMEOUT = 0.1
+        self.thread = threading.Thread(target=daemon.start, daemon=True)
+        self.thread.start()
+
+        while True:
+            try:
+                self.client.request("ping")
+                break
+
+            except ConnectionError:
+                time.sleep(0.01)
+
+    def test_request_without_daemon(self):
+        with self.assertRaises(ConnectionError):
+            self.client.request("ping")
+
+    def test_dropped_request_doesnt_look_like_a_missing_daemon(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(".tbsc.temp/control.sock")
+            server.listen()
+            thread = threading.Thread(target=lambda: server.accept()[0].close(),
+                                      daemon=True)
+            thread.start()
+
+            with self.assertRaises(RuntimeError):
+                self.client.request("ping")
+
+            thread.join()
+
+    def test_monitor_takes_effect_immediately(self):
+        self._start_daemon()
+        self.client.request("monitor", directory="temp")
+
+        self.assertEqual(os.listdir("temp"), [".tbsc"])
+        self.assertEqual(len(self.client.versions("temp")), 1)
+        self.assertEqual([directory for directory, _ in
+                          Manager(".tbsc.temp")], ["temp"])
+
+    def test_monitor_without_the_socket_is_picked_up(self):
+        daemon = Daemon(".tbsc.temp", polling_frequency=1, debug=True)
+        daemon.index = {"gone": []}
+        Manager(".tbsc.temp").monitor("temp")
+        daemon.start()
+
+        self.assertEqual(list(daemon.index), ["temp"])
+        self.assertEqual(len(daemon.index["temp"]), 1)
+
+    def test_unmonitor(self):
+        self._start_daemon()
+        self.client.request("monitor", directory="temp")
+        self.client.request("unmonitor", directory="temp")
+
+        self.assertEqual(len(list(Manager(".tbsc.temp"))), 0)
+        with self.assertRaises(RuntimeError):
+            self.client.request("snapshot", directory="temp")
+
+    def test_snapshot_now(self):
+        self._start_daemon()
+        self.client.request("monitor", directory="temp")
+        open("temp/FILE", "w").close()
+        self.client.request("snapshot")
+
+        versions = self.client.versions("temp")
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(sorted(versions, key=lambda version: version.time),
+                         sorted(SC("temp").versions,
+                                key=lambda version: version.time))
+
+    def test_stop_takes_effect_immediately(self):
+        self._start_daemon()
+        self.client.request("stop")
+        self.thread.join(timeout=5)
+
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(".tbsc.temp/control.sock"))
+
+    def test_socket_is_private(self):
+        self._start_daemon()
+        mode = os.stat(".tbsc.temp/control.sock").st_mode & 0o777
+        self.assertEqual(mode, 0o600)
+
+    def test_silent_client_doesnt_block_the_daemon(self):
+        self._start_daemon()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+            silent.connect(".tbsc.temp/control.sock")
+            self.client.request("stop")
+            self.thread.join(timeout=5)
+
+        self.assertFalse(self.thread.is_alive())
+
+    def tearDown(self):
+        if hasattr(self, "thread") and self.thread.is_alive():
+            self.client.request("stop")
+            self.thread.join()
+
+        shutil.rmtree(".tbsc.temp")
+        shutil.rmtree("temp")